@@ -8,74 +8,360 @@ using Gaphor's API. It creates a simple object-oriented model with:
 - Generalizations (inheritance)
 
 The resulting diagram is saved to a .gaphor file that can be opened in Gaphor.
+Run with --no-layout to skip placing the elements on the diagram, and with
+--cache to reuse a previously saved file (see ``save_model``).
 """
 
-# ruff: noqa: T201
-
-from gaphor import UML
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import NamedTuple
+
+from gaphor import UML, settings
+from gaphor.application import distribution
 from gaphor.core.eventmanager import EventManager
-from gaphor.core.modeling import Diagram, ElementFactory
+from gaphor.core.modeling import Base, Diagram, ElementFactory
+from gaphor.core.modeling.elementfactory import RecordingEventManager
 from gaphor.diagram.drop import drop
 from gaphor.services.modelinglanguage import ModelingLanguageService
 from gaphor.storage import storage
 from gaphor.UML.recipes import create_association, create_generalization
 
 
+@contextmanager
+def _coalesced_events(element_factory: ElementFactory) -> Iterator[None]:
+    """Record the events emitted in the block and dispatch them in one go.
+
+    Events are also dispatched if the block raises, since the elements
+    created up to that point stay in the model.
+    """
+    event_recorder = RecordingEventManager(element_factory.event_manager)
+    try:
+        with element_factory.block_events(event_recorder):
+            yield
+    finally:
+        event_recorder.replay()
+
+
+def drop_many(
+    diagram: Diagram, placements: Sequence[tuple[Base, float, float]]
+) -> None:
+    """Drop a batch of (element, x, y) placements on a diagram.
+
+    The events of all drops are dispatched in one go.
+    """
+    model = diagram.model
+    assert isinstance(model, ElementFactory)
+    with _coalesced_events(model):
+        for element, x, y in placements:
+            drop(element, diagram, x=x, y=y)
+
+
+class OperationDef(NamedTuple):
+    """An operation, with its input parameters as a slice of the parameter table.
+
+    The parameter table is part of the :class:`ModelSpec`.
+    """
+
+    name: str
+    return_type: str
+    param_start: int
+    param_stop: int
+
+
+class ClassSpec(NamedTuple):
+    """A class, with its attributes as parallel name and type tuples."""
+
+    name: str
+    attr_names: tuple[str, ...]
+    attr_types: tuple[str, ...]
+    op_defs: tuple[OperationDef, ...]
+
+
+class ModelSpec(NamedTuple):
+    """Classes, and the parameter table their operations refer to."""
+
+    classes: tuple[ClassSpec, ...]
+    param_names: tuple[str, ...]
+    param_types: tuple[str, ...]
+
+
+# The demo model
+SPEC = ModelSpec(
+    classes=(
+        ClassSpec(
+            "User",
+            ("id", "username", "email", "passwordHash"),
+            ("int", "string", "string", "string"),
+            (
+                OperationDef("login", "bool", 0, 1),
+                OperationDef("logout", "void", 1, 1),
+                OperationDef("updateProfile", "void", 1, 2),
+            ),
+        ),
+        ClassSpec(
+            "Product",
+            ("id", "name", "description", "price", "stockQuantity"),
+            ("int", "string", "string", "decimal", "int"),
+            (
+                OperationDef("updateStock", "void", 2, 3),
+                OperationDef("getDiscountedPrice", "decimal", 3, 4),
+            ),
+        ),
+        ClassSpec(
+            "Order",
+            ("id", "orderDate", "status", "totalAmount"),
+            ("int", "datetime", "string", "decimal"),
+            (
+                OperationDef("calculateTotal", "decimal", 4, 4),
+                OperationDef("updateStatus", "void", 4, 5),
+                OperationDef("cancel", "bool", 5, 5),
+            ),
+        ),
+        ClassSpec(
+            "OrderItem",
+            ("quantity", "unitPrice"),
+            ("int", "decimal"),
+            (OperationDef("getSubtotal", "decimal", 5, 5),),
+        ),
+        ClassSpec(
+            "ShoppingCart",
+            ("createdAt",),
+            ("datetime",),
+            (
+                OperationDef("addItem", "void", 5, 7),
+                OperationDef("removeItem", "void", 7, 8),
+                OperationDef("checkout", "Order", 8, 8),
+                OperationDef("getTotal", "decimal", 8, 8),
+            ),
+        ),
+        # Admin inherits from User
+        ClassSpec(
+            "Admin",
+            ("adminLevel",),
+            ("int",),
+            (
+                OperationDef("manageProducts", "void", 8, 8),
+                OperationDef("viewReports", "void", 8, 8),
+            ),
+        ),
+    ),
+    # Parameters of all operations, as parallel tuples
+    param_names=(
+        "password",
+        "email",
+        "quantity",
+        "discount",
+        "status",
+        "product",
+        "quantity",
+        "product",
+    ),
+    param_types=(
+        "string",
+        "string",
+        "int",
+        "float",
+        "string",
+        "Product",
+        "int",
+        "Product",
+    ),
+)
+
+
 def create_class_with_attributes(
     element_factory: ElementFactory,
     name: str,
-    attributes: list[tuple[str, str]],
-    operations: list[tuple[str, str, list[tuple[str, str]]]],
+    attr_names: Sequence[str],
+    attr_types: Sequence[str],
+    op_defs: Sequence[OperationDef],
+    param_names: Sequence[str],
+    param_types: Sequence[str],
 ) -> UML.Class:
     """Create a UML class with attributes and operations.
 
     Args:
         element_factory: The element factory to use for creating elements.
         name: Name of the class.
-        attributes: List of (name, type) tuples for attributes.
-        operations: List of (name, return_type, [(param_name, param_type)]) tuples.
+        attr_names: Names of the attributes.
+        attr_types: Types of the attributes, parallel to ``attr_names``.
+        op_defs: Operation definitions. Their parameter offsets select the
+            input parameters from ``param_names`` and ``param_types``.
+        param_names: Names of the input parameters.
+        param_types: Types of the input parameters, parallel to ``param_names``.
 
     Returns:
         The created UML Class.
     """
-    cls = element_factory.create(UML.Class)
-    cls.name = name
-
-    # Add attributes
-    for attr_name, attr_type in attributes:
-        attr = element_factory.create(UML.Property)
-        attr.name = attr_name
-        attr.typeValue = attr_type
-        cls.ownedAttribute = attr
-
-    # Add operations
-    for op_name, return_type, params in operations:
-        op = element_factory.create(UML.Operation)
-        op.name = op_name
-
-        # Add return parameter
-        if return_type:
-            return_param = element_factory.create(UML.Parameter)
-            return_param.direction = "return"
-            return_param.typeValue = return_type
-            op.ownedParameter = return_param
-
-        # Add input parameters
-        for param_name, param_type in params:
-            param = element_factory.create(UML.Parameter)
-            param.name = param_name
-            param.direction = "in"
-            param.typeValue = param_type
-            op.ownedParameter = param
-
-        cls.ownedOperation = op
+    create = element_factory.create
+    Property = UML.Property
+    Parameter = UML.Parameter
+    Operation = UML.Operation
+
+    # Subscribers see the events of the whole class in one dispatch run
+    with _coalesced_events(element_factory):
+        cls = create(UML.Class)
+        cls.name = name
+
+        # Add attributes
+        attrs: list[UML.Property] = []
+        for attr_name, attr_type in zip(attr_names, attr_types, strict=True):
+            attr = create(Property)
+            attr.name = attr_name
+            attr.typeValue = attr_type
+            attrs.append(attr)
+        cls.ownedAttribute.extend(attrs)
+
+        # Add operations
+        ops: list[UML.Operation] = []
+        for op_def in op_defs:
+            return_type = op_def.return_type
+            param_start, param_stop = op_def.param_start, op_def.param_stop
+            op = create(Operation)
+            op.name = op_def.name
+            op_params: list[UML.Parameter] = []
+
+            # Add return parameter
+            if return_type:
+                return_param = create(Parameter)
+                return_param.direction = "return"
+                return_param.typeValue = return_type
+                op_params.append(return_param)
+
+            # Add input parameters
+            for param_name, param_type in zip(
+                param_names[param_start:param_stop],
+                param_types[param_start:param_stop],
+                strict=True,
+            ):
+                param = create(Parameter)
+                param.name = param_name
+                param.direction = "in"
+                param.typeValue = param_type
+                op_params.append(param)
+
+            op.ownedParameter.extend(op_params)
+            ops.append(op)
+        cls.ownedOperation.extend(ops)
 
     return cls
 
 
-def main():
-    """Create a simple UML class diagram demonstrating an online store model."""
-    print("Creating UML Class Diagram Demo...")
+def build_model(
+    spec: ModelSpec, element_factory: ElementFactory
+) -> dict[str, UML.Class]:
+    """Create the classes described by ``spec``.
+
+    Returns:
+        The created classes, by name.
+    """
+    return {
+        cs.name: create_class_with_attributes(
+            element_factory,
+            cs.name,
+            cs.attr_names,
+            cs.attr_types,
+            cs.op_defs,
+            spec.param_names,
+            spec.param_types,
+        )
+        for cs in spec.classes
+    }
+
+
+def _counts(element_factory: ElementFactory) -> dict[type[Base], int]:
+    """Count the elements shown in the model summary in a single pass."""
+    counts: dict[type[Base], int] = dict.fromkeys(
+        (UML.Class, UML.Association, UML.Generalization, Diagram), 0
+    )
+    for element in element_factory:
+        for element_type in counts:
+            if isinstance(element, element_type):
+                counts[element_type] += 1
+    return counts
+
+
+def model_cache_key(*inputs: object) -> str:
+    """Hash of everything the saved demo model depends on.
+
+    That is the source of this script, the Gaphor version (it defines the
+    file format) and the ``inputs`` that :func:`main` builds the model from.
+    """
+    key = hashlib.blake2b(digest_size=24)
+    key.update(Path(__file__).read_bytes())
+    key.update(distribution().version.encode("utf-8"))
+    key.update(repr(inputs).encode("utf-8"))
+    return key.hexdigest()
+
+
+def save_model(
+    element_factory: ElementFactory, output_file: str, cache_key: str | None = None
+) -> None:
+    """Save the model to a file.
+
+    If a ``cache_key`` (see :func:`model_cache_key`) is given, the saved file
+    is cached, and copied on later runs with the same key, instead of
+    serializing the model again.
+
+    The cache is only a shortcut for repeated demo runs, with known limits:
+
+    - A hit copies the file of an earlier run. Element ids in that file
+      differ from the ids of ``element_factory``.
+    - The key does not cover the Gaphor library code. On a development
+      checkout the version stays the same, so changes to storage, recipes
+      or diagram items are not picked up.
+    - Entries are never removed from the cache directory.
+    """
+    cached_file = (
+        settings.get_cache_dir() / "demo" / f"{cache_key}.gaphor" if cache_key else None
+    )
+    if cached_file and cached_file.exists():
+        shutil.copyfile(cached_file, output_file)
+        return
+
+    with open(output_file, "w") as out:
+        storage.save(out, element_factory)
+
+    if cached_file:
+        # Copy via a temporary file, so an interrupted run leaves no partial entry
+        cached_file.parent.mkdir(exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cached_file.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(output_file, tmp_file)
+            os.replace(tmp_file, cached_file)
+        finally:
+            with suppress(FileNotFoundError):
+                os.unlink(tmp_file)
+
+
+def main(
+    *,
+    layout: bool = True,
+    output_file: str | None = "demo_online_store.gaphor",
+    cache: bool = False,
+) -> ElementFactory:
+    """Create a simple UML class diagram demonstrating an online store model.
+
+    Args:
+        layout: Add the model elements to the diagram. Disable this if only
+            the model itself is of interest.
+        output_file: File to save the model to. If ``None``, the model
+            is not saved.
+        cache: Reuse a previously saved file, if any. See :func:`save_model`
+            for the limits. By default the model that was just built is saved.
+
+    Returns:
+        The element factory holding the model.
+    """
+    # Progress messages are collected and written out in one go at the end
+    log: list[str] = ["Creating UML Class Diagram Demo..."]
 
     # Initialize the element factory and modeling language
     event_manager = EventManager()
@@ -86,184 +372,123 @@ def main():
     package = element_factory.create(UML.Package)
     package.name = "OnlineStore"
 
-    # Create the User class
-    user = create_class_with_attributes(
-        element_factory,
-        "User",
-        attributes=[
-            ("id", "int"),
-            ("username", "string"),
-            ("email", "string"),
-            ("passwordHash", "string"),
-        ],
-        operations=[
-            ("login", "bool", [("password", "string")]),
-            ("logout", "void", []),
-            ("updateProfile", "void", [("email", "string")]),
-        ],
-    )
-
-    # Create the Product class
-    product = create_class_with_attributes(
-        element_factory,
-        "Product",
-        attributes=[
-            ("id", "int"),
-            ("name", "string"),
-            ("description", "string"),
-            ("price", "decimal"),
-            ("stockQuantity", "int"),
-        ],
-        operations=[
-            ("updateStock", "void", [("quantity", "int")]),
-            ("getDiscountedPrice", "decimal", [("discount", "float")]),
-        ],
-    )
-
-    # Create the Order class
-    order = create_class_with_attributes(
-        element_factory,
-        "Order",
-        attributes=[
-            ("id", "int"),
-            ("orderDate", "datetime"),
-            ("status", "string"),
-            ("totalAmount", "decimal"),
-        ],
-        operations=[
-            ("calculateTotal", "decimal", []),
-            ("updateStatus", "void", [("status", "string")]),
-            ("cancel", "bool", []),
-        ],
-    )
-
-    # Create the OrderItem class
-    order_item = create_class_with_attributes(
-        element_factory,
-        "OrderItem",
-        attributes=[
-            ("quantity", "int"),
-            ("unitPrice", "decimal"),
-        ],
-        operations=[
-            ("getSubtotal", "decimal", []),
-        ],
-    )
-
-    # Create the ShoppingCart class
-    cart = create_class_with_attributes(
-        element_factory,
-        "ShoppingCart",
-        attributes=[
-            ("createdAt", "datetime"),
-        ],
-        operations=[
-            ("addItem", "void", [("product", "Product"), ("quantity", "int")]),
-            ("removeItem", "void", [("product", "Product")]),
-            ("checkout", "Order", []),
-            ("getTotal", "decimal", []),
-        ],
-    )
-
-    # Create the Admin class (inherits from User)
-    admin = create_class_with_attributes(
-        element_factory,
-        "Admin",
-        attributes=[
-            ("adminLevel", "int"),
-        ],
-        operations=[
-            ("manageProducts", "void", []),
-            ("viewReports", "void", []),
-        ],
+    # Create the classes
+    classes = build_model(SPEC, element_factory)
+    user = classes["User"]
+    product = classes["Product"]
+    order = classes["Order"]
+    order_item = classes["OrderItem"]
+    cart = classes["ShoppingCart"]
+    admin = classes["Admin"]
+
+    log.append(
+        "  Created classes: User, Product, Order, OrderItem, ShoppingCart, Admin"
     )
 
-    print("  Created classes: User, Product, Order, OrderItem, ShoppingCart, Admin")
-
     # Create relationships
 
     # Admin inherits from User
-    create_generalization(user, admin)
-    print("  Created generalization: Admin extends User")
+    gen = create_generalization(user, admin)
+    log.append("  Created generalization: Admin extends User")
 
     # User has many Orders
     user_orders_assoc = create_association(user, order)
-    user_orders_assoc.memberEnd[0].name = "orders"
-    user_orders_assoc.memberEnd[1].name = "customer"
-    print("  Created association: User -- Order")
+    ends = user_orders_assoc.memberEnd
+    ends[0].name = "orders"
+    ends[1].name = "customer"
+    log.append("  Created association: User -- Order")
 
     # User has one ShoppingCart
     user_cart_assoc = create_association(user, cart)
-    user_cart_assoc.memberEnd[0].name = "cart"
-    user_cart_assoc.memberEnd[1].name = "owner"
-    print("  Created association: User -- ShoppingCart")
+    ends = user_cart_assoc.memberEnd
+    ends[0].name = "cart"
+    ends[1].name = "owner"
+    log.append("  Created association: User -- ShoppingCart")
 
     # Order has many OrderItems
     order_items_assoc = create_association(order, order_item)
-    order_items_assoc.memberEnd[0].name = "items"
-    order_items_assoc.memberEnd[1].name = "order"
-    print("  Created association: Order -- OrderItem")
+    ends = order_items_assoc.memberEnd
+    ends[0].name = "items"
+    ends[1].name = "order"
+    log.append("  Created association: Order -- OrderItem")
 
     # OrderItem refers to a Product
     item_product_assoc = create_association(order_item, product)
-    item_product_assoc.memberEnd[0].name = "product"
-    item_product_assoc.memberEnd[1].name = "orderItems"
-    print("  Created association: OrderItem -- Product")
+    ends = item_product_assoc.memberEnd
+    ends[0].name = "product"
+    ends[1].name = "orderItems"
+    log.append("  Created association: OrderItem -- Product")
 
     # ShoppingCart contains Products (via implicit cart items)
     cart_product_assoc = create_association(cart, product)
-    cart_product_assoc.memberEnd[0].name = "products"
-    cart_product_assoc.memberEnd[1].name = "carts"
-    print("  Created association: ShoppingCart -- Product")
+    ends = cart_product_assoc.memberEnd
+    ends[0].name = "products"
+    ends[1].name = "carts"
+    log.append("  Created association: ShoppingCart -- Product")
 
     # Create the diagram
     diagram = element_factory.create(Diagram)
     diagram.name = "Online Store Class Diagram"
 
-    # Position classes on the diagram
-    # Top row: User, Admin
-    drop(user, diagram, x=100, y=50)
-    drop(admin, diagram, x=100, y=300)
-
-    # Middle row: ShoppingCart, Order
-    drop(cart, diagram, x=400, y=50)
-    drop(order, diagram, x=400, y=300)
-
-    # Right side: Product, OrderItem
-    drop(product, diagram, x=700, y=50)
-    drop(order_item, diagram, x=700, y=300)
-
-    print("  Added classes to diagram")
-
-    # Drop associations on the diagram
-    drop(user_orders_assoc, diagram, x=0, y=0)
-    drop(user_cart_assoc, diagram, x=0, y=0)
-    drop(order_items_assoc, diagram, x=0, y=0)
-    drop(item_product_assoc, diagram, x=0, y=0)
-    drop(cart_product_assoc, diagram, x=0, y=0)
-
-    print("  Added associations to diagram")
-
-    # Drop generalization
-    gen = next(element_factory.select(UML.Generalization))
-    drop(gen, diagram, x=0, y=0)
-    print("  Added generalization to diagram")
+    # Presentation layout can be skipped for non-interactive runs
+    if layout:
+        # Position classes on the diagram
+        drop_many(
+            diagram,
+            (
+                # Top row: User, Admin
+                (user, 100, 50),
+                (admin, 100, 300),
+                # Middle row: ShoppingCart, Order
+                (cart, 400, 50),
+                (order, 400, 300),
+                # Right side: Product, OrderItem
+                (product, 700, 50),
+                (order_item, 700, 300),
+            ),
+        )
+        log.append("  Added classes to diagram")
+
+        # Drop associations on the diagram
+        drop_many(
+            diagram,
+            (
+                (user_orders_assoc, 0, 0),
+                (user_cart_assoc, 0, 0),
+                (order_items_assoc, 0, 0),
+                (item_product_assoc, 0, 0),
+                (cart_product_assoc, 0, 0),
+            ),
+        )
+        log.append("  Added associations to diagram")
+
+        # Drop generalization
+        drop(gen, diagram, x=0, y=0)
+        log.append("  Added generalization to diagram")
 
     # Save the model
-    output_file = "demo_online_store.gaphor"
-    with open(output_file, "w") as out:
-        storage.save(out, element_factory)
+    if output_file:
+        save_model(
+            element_factory,
+            output_file,
+            cache_key=model_cache_key(layout) if cache else None,
+        )
 
-    print(f"\nDiagram saved to: {output_file}")
-    print("Open this file in Gaphor to view and edit the diagram.")
+        log.append(f"\nDiagram saved to: {output_file}")
+        log.append("Open this file in Gaphor to view and edit the diagram.")
 
     # Print summary
-    print("\n--- Model Summary ---")
-    print(f"Classes: {len(list(element_factory.select(UML.Class)))}")
-    print(f"Associations: {len(list(element_factory.select(UML.Association)))}")
-    print(f"Generalizations: {len(list(element_factory.select(UML.Generalization)))}")
-    print(f"Diagrams: {len(list(element_factory.select(Diagram)))}")
+    log.append("\n--- Model Summary ---")
+    counts = _counts(element_factory)
+    log.append(f"Classes: {counts[UML.Class]}")
+    log.append(f"Associations: {counts[UML.Association]}")
+    log.append(f"Generalizations: {counts[UML.Generalization]}")
+    log.append(f"Diagrams: {counts[Diagram]}")
+
+    sys.stdout.write("\n".join(log) + "\n")
+
+    return element_factory
 
 
 if __name__ == "__main__":
-    main()
+    main(layout="--no-layout" not in sys.argv, cache="--cache" in sys.argv)
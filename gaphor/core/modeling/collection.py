@@ -73,6 +73,16 @@ class collection[T]:
         else:
             raise TypeError(f"Object is not of type {self.type.__name__}")
 
+    def extend(self, values: Sequence[T]) -> None:
+        """Append all values.
+
+        All values are type checked before the collection is changed.
+        """
+        if not all(isinstance(value, self.type) for value in values):
+            raise TypeError(f"Object is not of type {self.type.__name__}")
+        for value in values:
+            self.property.set(self.object, value)
+
     def remove(self, value: T) -> None:
         if value in self.items:
             self.property.delete(self.object, value)
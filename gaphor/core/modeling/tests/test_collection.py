@@ -40,6 +40,25 @@ def test_append_wrong_type():
         c.append("s")  # type: ignore[arg-type]
 
 
+def test_extend():
+    p = MockProperty()
+    o = object()
+    c = collection(p, o, str)
+    c.extend(["s", "t"])
+
+    assert p.values == [(o, "s"), (o, "t")]
+
+
+def test_extend_wrong_type_does_not_change_collection():
+    p = MockProperty()
+    c = collection(p, None, int)
+
+    with pytest.raises(TypeError):
+        c.extend([1, "s"])  # type: ignore[list-item]
+
+    assert p.values == []
+
+
 def test_size():
     c = collection(None, None, int)
     c.items = [1, 2]  # type: ignore[assignment]
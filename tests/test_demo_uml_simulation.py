@@ -4,48 +4,96 @@ These tests verify that the demo simulation correctly creates UML elements
 including classes, attributes, operations, associations, and generalizations.
 """
 
+import importlib.util
+from pathlib import Path
+from types import SimpleNamespace
+
 import pytest
 
 from gaphor import UML
-from gaphor.core.modeling import Diagram
+from gaphor.core.eventmanager import EventManager, event_handler
+from gaphor.core.modeling import Diagram, ElementCreated, ElementFactory, Presentation
+from gaphor.core.modeling.elementdispatcher import ElementDispatcher
+from gaphor.core.modeling.modelinglanguage import (
+    CoreModelingLanguage,
+    MockModelingLanguage,
+)
 from gaphor.diagram.drop import drop
+from gaphor.diagram.general.modelinglanguage import GeneralModelingLanguage
+from gaphor.SysML.modelinglanguage import SysMLModelingLanguage
+from gaphor.UML.modelinglanguage import UMLModelingLanguage
 from gaphor.UML.recipes import create_association, create_generalization
 
 
-class TestCreateClassWithAttributes:
-    """Tests for creating UML classes with attributes and operations."""
+@pytest.fixture(scope="module")
+def event_manager():
+    return EventManager()
 
-    def test_create_simple_class(self, element_factory):
-        """Test creating a simple class without attributes or operations."""
-        cls = element_factory.create(UML.Class)
-        cls.name = "SimpleClass"
 
-        assert cls.name == "SimpleClass"
-        assert len(cls.ownedAttribute) == 0
-        assert len(cls.ownedOperation) == 0
+@pytest.fixture(scope="module")
+def modeling_language():
+    return MockModelingLanguage(
+        CoreModelingLanguage(),
+        GeneralModelingLanguage(),
+        UMLModelingLanguage(),
+        SysMLModelingLanguage(),
+    )
+
+
+@pytest.fixture(scope="module")
+def element_factory(event_manager, modeling_language):
+    """Share one element factory between all tests in this module."""
+    element_factory = ElementFactory(
+        event_manager, ElementDispatcher(event_manager, modeling_language)
+    )
+    yield element_factory
+    element_factory.shutdown()
+
+
+@pytest.fixture(scope="module")
+def demo():
+    """The demo script, loaded as a module."""
+    path = Path(__file__).parent.parent / "examples" / "demo_uml_simulation.py"
+    spec = importlib.util.spec_from_file_location("demo_uml_simulation", path)
+    assert spec and spec.loader
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
 
-    def test_create_class_with_attributes(self, element_factory):
-        """Test creating a class with attributes."""
+@pytest.fixture(autouse=True)
+def flush_element_factory(element_factory):
+    yield
+    element_factory.flush()
+
+
+class TestCreateClassWithAttributes:
+    """Tests for creating UML classes with attributes and operations."""
+
+    @pytest.mark.parametrize(
+        "attributes",
+        [
+            [],
+            [("id", "int")],
+            [("id", "int"), ("username", "string")],
+        ],
+    )
+    def test_create_class_with_attributes(self, element_factory, attributes):
+        """Test creating a class with zero or more attributes."""
         cls = element_factory.create(UML.Class)
         cls.name = "User"
 
         # Add attributes
-        attr1 = element_factory.create(UML.Property)
-        attr1.name = "id"
-        attr1.typeValue = "int"
-        cls.ownedAttribute = attr1
-
-        attr2 = element_factory.create(UML.Property)
-        attr2.name = "username"
-        attr2.typeValue = "string"
-        cls.ownedAttribute = attr2
+        for attr_name, attr_type in attributes:
+            attr = element_factory.create(UML.Property)
+            attr.name = attr_name
+            attr.typeValue = attr_type
+            cls.ownedAttribute = attr
 
         assert cls.name == "User"
-        assert len(cls.ownedAttribute) == 2
-        assert cls.ownedAttribute[0].name == "id"
-        assert cls.ownedAttribute[0].typeValue == "int"
-        assert cls.ownedAttribute[1].name == "username"
-        assert cls.ownedAttribute[1].typeValue == "string"
+        assert len(cls.ownedAttribute) == len(attributes)
+        assert [(a.name, a.typeValue) for a in cls.ownedAttribute] == attributes
+        assert len(cls.ownedOperation) == 0
 
     def test_create_class_with_operations(self, element_factory):
         """Test creating a class with operations."""
@@ -74,23 +122,27 @@ class TestCreateClassWithAttributes:
         assert cls.ownedOperation[0].name == "login"
         assert len(cls.ownedOperation[0].ownedParameter) == 2
 
-    def test_create_class_with_multiple_operations(self, element_factory):
+    @pytest.mark.parametrize(
+        "operations",
+        [
+            ["calculateTotal", "cancel"],
+            ["addItem", "removeItem", "checkout", "getTotal"],
+        ],
+    )
+    def test_create_class_with_multiple_operations(self, element_factory, operations):
         """Test creating a class with multiple operations."""
         cls = element_factory.create(UML.Class)
         cls.name = "ShoppingCart"
 
-        operations = ["addItem", "removeItem", "checkout", "getTotal"]
         for op_name in operations:
             op = element_factory.create(UML.Operation)
             op.name = op_name
             cls.ownedOperation = op
 
-        assert len(cls.ownedOperation) == 4
-        op_names = [op.name for op in cls.ownedOperation]
-        assert "addItem" in op_names
-        assert "removeItem" in op_names
-        assert "checkout" in op_names
-        assert "getTotal" in op_names
+        assert len(cls.ownedOperation) == len(operations)
+        op_names = {op.name for op in cls.ownedOperation}
+        for op_name in operations:
+            assert op_name in op_names
 
 
 class TestAssociations:
@@ -121,11 +173,12 @@ class TestAssociations:
         order.name = "Order"
 
         assoc = create_association(user, order)
-        assoc.memberEnd[0].name = "orders"
-        assoc.memberEnd[1].name = "customer"
+        ends = assoc.memberEnd
+        ends[0].name = "orders"
+        ends[1].name = "customer"
 
-        assert assoc.memberEnd[0].name == "orders"
-        assert assoc.memberEnd[1].name == "customer"
+        assert ends[0].name == "orders"
+        assert ends[1].name == "customer"
 
     def test_multiple_associations(self, element_factory):
         """Test creating multiple associations."""
@@ -141,7 +194,7 @@ class TestAssociations:
         assoc1 = create_association(user, order)
         assoc2 = create_association(user, cart)
 
-        associations = list(element_factory.select(UML.Association))
+        associations = set(element_factory.select(UML.Association))
         assert len(associations) == 2
         assert assoc1 in associations
         assert assoc2 in associations
@@ -285,8 +338,9 @@ class TestOnlineStoreModel:
         created_classes = list(element_factory.select(UML.Class))
         assert len(created_classes) == 6
 
+        names_in_factory = {c.name for c in created_classes}
         for name in class_names:
-            assert any(c.name == name for c in created_classes)
+            assert name in names_in_factory
 
     def test_create_online_store_relationships(self, element_factory):
         """Test creating all relationships for the online store model."""
@@ -320,12 +374,12 @@ class TestOnlineStoreModel:
         create_association(cart, product)
 
         # Verify
-        generalizations = list(element_factory.select(UML.Generalization))
+        generalizations = set(element_factory.select(UML.Generalization))
         assert len(generalizations) == 1
         assert gen.general is user
         assert gen.specific is admin
 
-        associations = list(element_factory.select(UML.Association))
+        associations = set(element_factory.select(UML.Association))
         assert len(associations) == 5
 
     def test_create_complete_online_store_diagram(self, element_factory):
@@ -391,11 +445,9 @@ class TestPackageOrganization:
         classes = list(element_factory.select(UML.Class))
         assert len(classes) == 3
 
-        # Query with predicate
+        # Query by type and name
         class2 = next(
-            element_factory.select(
-                lambda e: isinstance(e, UML.Class) and e.name == "Class2"
-            )
+            c for c in element_factory.select(UML.Class) if c.name == "Class2"
         )
         assert class2.name == "Class2"
 
@@ -419,9 +471,11 @@ class TestOperationParameters:
 
         cls.ownedOperation = op
 
-        return_params = [p for p in op.ownedParameter if p.direction == "return"]
-        assert len(return_params) == 1
-        assert return_params[0].typeValue == "int"
+        return_params = (p for p in op.ownedParameter if p.direction == "return")
+        return_param = next(return_params, None)
+        assert return_param is not None
+        assert return_param.typeValue == "int"
+        assert next(return_params, None) is None
 
     def test_operation_with_input_parameters(self, element_factory):
         """Test operation with input parameters."""
@@ -446,7 +500,231 @@ class TestOperationParameters:
 
         cls.ownedOperation = op
 
-        input_params = [p for p in op.ownedParameter if p.direction == "in"]
-        assert len(input_params) == 2
-        assert input_params[0].name == "a"
-        assert input_params[1].name == "b"
+        assert [p.name for p in op.ownedParameter if p.direction == "in"] == ["a", "b"]
+
+
+class TestDemoModelCache:
+    """Tests for caching the saved demo model."""
+
+    def test_cache_miss_saves_model(
+        self, demo, element_factory, tmp_path, tmp_get_cache_config_dir
+    ):
+        cls = element_factory.create(UML.Class)
+        cls.name = "User"
+        output_file = tmp_path / "out.gaphor"
+
+        demo.save_model(element_factory, str(output_file), cache_key="key")
+
+        assert "User" in output_file.read_text()
+        cached_file = tmp_path / "demo" / "key.gaphor"
+        assert cached_file.read_text() == output_file.read_text()
+        assert not list((tmp_path / "demo").glob("*.tmp"))
+
+    def test_cache_hit_copies_cached_model(
+        self, demo, element_factory, tmp_path, tmp_get_cache_config_dir
+    ):
+        cls = element_factory.create(UML.Class)
+        cls.name = "User"
+        first_file = tmp_path / "first.gaphor"
+        demo.save_model(element_factory, str(first_file), cache_key="key")
+
+        element_factory.flush()
+        second_file = tmp_path / "second.gaphor"
+        demo.save_model(element_factory, str(second_file), cache_key="key")
+
+        assert second_file.read_text() == first_file.read_text()
+
+    def test_different_key_misses_cache(
+        self, demo, element_factory, tmp_path, tmp_get_cache_config_dir
+    ):
+        cls = element_factory.create(UML.Class)
+        cls.name = "User"
+        first_file = tmp_path / "first.gaphor"
+        demo.save_model(
+            element_factory, str(first_file), cache_key=demo.model_cache_key(True)
+        )
+
+        cls.name = "Customer"
+        second_file = tmp_path / "second.gaphor"
+        demo.save_model(
+            element_factory, str(second_file), cache_key=demo.model_cache_key(False)
+        )
+
+        assert "Customer" in second_file.read_text()
+        assert second_file.read_text() != first_file.read_text()
+
+    def test_same_key_with_changed_model_returns_stale_file(
+        self, demo, element_factory, tmp_path, tmp_get_cache_config_dir
+    ):
+        cls = element_factory.create(UML.Class)
+        cls.name = "User"
+        first_file = tmp_path / "first.gaphor"
+        demo.save_model(element_factory, str(first_file), cache_key="key")
+
+        cls.name = "Customer"
+        second_file = tmp_path / "second.gaphor"
+        demo.save_model(element_factory, str(second_file), cache_key="key")
+
+        # The key, not the model, decides a hit
+        assert second_file.read_text() == first_file.read_text()
+        assert "Customer" not in second_file.read_text()
+
+    def test_cache_key_depends_on_gaphor_version(self, demo, monkeypatch):
+        key = demo.model_cache_key(True)
+
+        monkeypatch.setattr(
+            demo, "distribution", lambda: SimpleNamespace(version="0.0.0")
+        )
+
+        assert demo.model_cache_key(True) != key
+
+    def test_no_cache_without_key(
+        self, demo, element_factory, tmp_path, tmp_get_cache_config_dir
+    ):
+        output_file = tmp_path / "out.gaphor"
+
+        demo.save_model(element_factory, str(output_file))
+
+        assert output_file.exists()
+        assert not (tmp_path / "demo").exists()
+
+
+class TestDemoMain:
+    """Tests for running the demo."""
+
+    def test_main_without_layout(self, demo, tmp_path, tmp_get_cache_config_dir):
+        element_factory = demo.main(layout=False, output_file=None)
+
+        assert not list(element_factory.select(Presentation))
+        assert len(list(element_factory.select(UML.Class))) == 6
+        assert len(list(element_factory.select(UML.Association))) == 5
+        assert not list(tmp_path.iterdir())
+
+        element_factory.shutdown()
+
+    def test_main_with_layout(self, demo, tmp_path, tmp_get_cache_config_dir):
+        output_file = tmp_path / "demo.gaphor"
+
+        element_factory = demo.main(output_file=str(output_file))
+
+        diagram = next(element_factory.select(Diagram))
+        # 6 classes + 5 associations + 1 generalization
+        assert len(diagram.ownedPresentation) == 12
+        assert diagram.id in output_file.read_text()
+        assert not (tmp_path / "demo").exists()
+
+        element_factory.shutdown()
+
+    def test_main_with_cache(self, demo, tmp_path, tmp_get_cache_config_dir):
+        output_file = tmp_path / "demo.gaphor"
+
+        element_factory = demo.main(output_file=str(output_file), cache=True)
+
+        (cached_file,) = (tmp_path / "demo").glob("*.gaphor")
+        assert cached_file.read_text() == output_file.read_text()
+
+        element_factory.shutdown()
+
+
+class TestDemoEvents:
+    """Tests for batching events in the demo."""
+
+    def test_events_are_dispatched_when_block_fails(
+        self, demo, element_factory, event_manager
+    ):
+        events = []
+
+        @event_handler(ElementCreated)
+        def on_created(event):
+            events.append(event)
+
+        event_manager.subscribe(on_created)
+        try:
+            with pytest.raises(ValueError):
+                # Attribute names and types differ in length
+                demo.create_class_with_attributes(
+                    element_factory, "Broken", ("id", "name"), ("int",), (), (), ()
+                )
+        finally:
+            event_manager.unsubscribe(on_created)
+
+        created = [e.element for e in events]
+        assert any(isinstance(e, UML.Class) and e.name == "Broken" for e in created)
+        assert all(e in element_factory for e in created)
+
+    def test_drop_many_connects_relationships(self, demo, element_factory):
+        parent = element_factory.create(UML.Class)
+        child = element_factory.create(UML.Class)
+        gen = create_generalization(parent, child)
+        assoc = create_association(parent, child)
+        diagram = element_factory.create(Diagram)
+
+        demo.drop_many(diagram, ((parent, 100, 100), (child, 100, 300)))
+        demo.drop_many(diagram, ((assoc, 0, 0), (gen, 0, 0)))
+
+        class_items = {parent.presentation[0], child.presentation[0]}
+        for line in (assoc.presentation[0], gen.presentation[0]):
+            connected = {
+                diagram.connections.get_connection(handle).connected
+                for handle in (line.head, line.tail)
+            }
+            assert connected == class_items
+
+
+class TestBuildModel:
+    """Tests for building the demo model from a spec."""
+
+    def test_build_demo_model(self, demo, element_factory):
+        classes = demo.build_model(demo.SPEC, element_factory)
+
+        assert set(classes) == {
+            "User",
+            "Product",
+            "Order",
+            "OrderItem",
+            "ShoppingCart",
+            "Admin",
+        }
+        user = classes["User"]
+        assert [(a.name, a.typeValue) for a in user.ownedAttribute] == [
+            ("id", "int"),
+            ("username", "string"),
+            ("email", "string"),
+            ("passwordHash", "string"),
+        ]
+        assert [op.name for op in user.ownedOperation] == [
+            "login",
+            "logout",
+            "updateProfile",
+        ]
+
+        add_item = next(
+            op for op in classes["ShoppingCart"].ownedOperation if op.name == "addItem"
+        )
+        assert [
+            (p.name, p.direction, p.typeValue) for p in add_item.ownedParameter
+        ] == [
+            (None, "return", "void"),
+            ("product", "in", "Product"),
+            ("quantity", "in", "int"),
+        ]
+
+    def test_build_model_uses_parameters_from_spec(self, demo, element_factory):
+        spec = demo.ModelSpec(
+            classes=(
+                demo.ClassSpec(
+                    "Calculator", (), (), (demo.OperationDef("add", "int", 0, 2),)
+                ),
+            ),
+            param_names=("a", "b"),
+            param_types=("int", "int"),
+        )
+
+        classes = demo.build_model(spec, element_factory)
+
+        (op,) = classes["Calculator"].ownedOperation
+        assert [(p.name, p.direction) for p in op.ownedParameter] == [
+            (None, "return"),
+            ("a", "in"),
+            ("b", "in"),
+        ]